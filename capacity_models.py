@@ -4,6 +4,8 @@
 import math
 from typing import Tuple
 
+import numpy as np
+
 
 def two_peak_guassian(
     x: int,
@@ -85,10 +87,54 @@ def guassian(
     return psi * math.exp(-1 * (x / theta_x) ** 2 - (y / theta_y) ** 2)
 
 
+def two_peak_gaussian_grid(
+    X: int,
+    Y: int,
+    psi: float = 4.0,
+    peak1: Tuple[float, float] = (0.25, 0.25),
+    peak2: Tuple[float, float] = (0.75, 0.75),
+    theta_x: float = 0.3,
+    theta_y: float = 0.3,
+) -> np.ndarray:
+    """
+    Vectorized version of `two_peak_guassian()`, evaluates the twin-peak guassian distribution
+    over every point of an `X` by `Y` grid in one pass.
+
+    Args:
+        X (int): Width of the grid.
+        Y (int): Height of the grid.
+        psi (float): Coefficent for guassian curve. Defaults to `4.0`.
+        peak1 (Tuple[float, float]): Center of peak one described as a pair of percentages of the max bound on x and y. Range is `0.0 <= x, y <= 1.0`. Defaults are `(0.25. 0.25)`.
+        peak2 (Tuple[float, float]): Center of peak two described as a pair of percentages of the max bound on x and y. Range is `0.0 <= x, y <= 1.0`. Defaults are `(0.75. 0.75)`.
+        theta_x (float): Theta_x for guassian curve. Defaults to `0.3`.
+        theta_y (float): Theta_y for guassian curve. Defaults to `0.3`.
+    Returns
+        np.ndarray: Integer array of shape `(X, Y)`, where `grid[x, y]` equals `two_peak_guassian(x, y, bounds=(X, Y))`.
+    """
+    xs = np.arange(X)[:, None]
+    ys = np.arange(Y)[None, :]
+
+    theta_x = theta_x * X
+    theta_y = theta_y * Y
+
+    dx1 = xs - peak1[0] * X
+    dy1 = ys - peak1[1] * Y
+    dx2 = xs - peak2[0] * X
+    dy2 = ys - peak2[1] * Y
+
+    grid = psi * np.exp(-((dx1 / theta_x) ** 2) - (dy1 / theta_y) ** 2) + psi * np.exp(
+        -((dx2 / theta_x) ** 2) - (dy2 / theta_y) ** 2
+    )
+
+    # np.rint rounds half to even, same as the builtin round() used by two_peak_guassian()
+    return np.rint(grid).astype(np.int32)
+
+
 if __name__ == "__main__":
     # Code to test and visualize the output of the distribution in the terminal.
     # Default values will display within color range, outputs above 4 will break this code...
     import platform
+    import sys
 
     # Array to map values to color code, f(x, y) equals the index of the color code.
     color_map = [
@@ -109,9 +155,10 @@ if __name__ == "__main__":
         kernel32 = ctypes.windll.kernel32
         kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
 
-    # Test twin-peak distribution
-    for x in range(50):
-        for y in range(50):
-            num = two_peak_guassian(x, y)
-            print(f"{color_map[num]}{num} {RESET}", end="")
-        print()
+    # Test twin-peak distribution, evaluated in one call and written to the terminal at once
+    grid = two_peak_gaussian_grid(50, 50)
+    rows = [
+        "".join(f"{color_map[num]}{num} {RESET}" for num in row)
+        for row in grid.tolist()
+    ]
+    sys.stdout.write("\n".join(rows) + "\n")
@@ -1,5 +1,5 @@
 # SPDX-License-Identifier: MIT
 # Copyright (c) 2024 Iain Crowe <iainccrowe@gmail.com>
 
-from components.agent import Agent, init_agents
+from components.agent import Agent, init_agents, move_agents
 from components.landscape import Landscape
@@ -4,19 +4,86 @@
 from __future__ import annotations
 
 from enum import Enum
-import random
-from typing import List, Optional, Tuple
+from typing import Any, Callable, FrozenSet, List, Optional, Tuple
 
-from components.landscape import Cell, Landscape
+# prange is only used by the generated kernel sources, which are compiled in this module
+from numba import njit, prange  # noqa: F401
+import numpy as np
+
+from components.landscape import Landscape
 
 
 class Sex(Enum):
+    """
+    Labels for `Agent.sex`, which is stored as a plain `bool` so it is cheap to compare.
+    `Sex(agent.sex)` gives the label for an agent.
+    """
+
     MALE = False
     FEMALE = True
 
 
+def _diamond_offsets(radius: int) -> np.ndarray:
+    """
+    Calculates the offsets of every cell in a von Neumann neighborhood.
+
+    Args:
+        radius (int): Radius of the neighborhood.
+    Returns:
+        np.ndarray: Array of shape `(N, 2)` holding the `(dx, dy)` offset of each cell.
+    """
+    return np.array(
+        [
+            (dx, dy)
+            for dx in range(-radius, radius + 1)
+            for dy in range(-radius + abs(dx), radius - abs(dx) + 1)
+        ],
+        dtype=np.int32,
+    )
+
+
+# Neighborhood offsets for each of the default fov values, other values are added on first use
+_DIAMOND_OFFSETS = {radius: _diamond_offsets(radius) for radius in range(1, 7)}
+
+
+class _LandscapeState:
+    """
+    Descriptor for agent state that lives in one of the landscape's per-agent arrays, see
+    `AGENT_ARRAYS` in `components.landscape`.
+    """
+
+    def __init__(self, array_name: str, cast: Callable[[Any], Any]) -> None:
+        """
+        Args:
+            array_name (str): Name of the landscape array holding the state.
+            cast (Callable[[Any], Any]): Converts the stored NumPy scalar to a Python value.
+        """
+        self.array_name = array_name
+        self.cast = cast
+
+    def __get__(self, agent: Optional[Agent], owner: type) -> Any:
+        if agent is None:
+            return self
+        return self.cast(getattr(agent.parent, self.array_name)[agent.id])
+
+    def __set__(self, agent: Agent, value: Any) -> None:
+        getattr(agent.parent, self.array_name)[agent.id] = value
+
+
 class Agent:
-    curr_id = 0
+    # State read every tick, stored on the landscape
+    x = _LandscapeState("agent_x", int)
+    y = _LandscapeState("agent_y", int)
+    fov = _LandscapeState("agent_fov", int)
+    wealth = _LandscapeState("agent_wealth", float)
+    metabolism = _LandscapeState("agent_metabolism", float)
+    alive = _LandscapeState("agent_alive", bool)
+    sex = _LandscapeState("agent_sex", bool)
+    time_of_birth = _LandscapeState("agent_birth", int)
+    lifespan = _LandscapeState("agent_lifespan", float)
+    endowment = _LandscapeState("agent_endowment", float)
+    _fertiliy_begin = _LandscapeState("agent_fertility_begin", float)
+    _fertiliy_end = _LandscapeState("agent_fertility_end", float)
 
     def __init__(
         self,
@@ -39,54 +106,41 @@ class Agent:
             lifespan (float, optional): Length of agent's life. Defaults to `x ∈ R and x ∈ [60.0, 100.0]`.
         """
         # Identifier and parent ref
-        self.id = Agent.next_id()
+        self.id = landscape.next_agent_id()
         self.parent = landscape
+        landscape.reserve_agent(self.id)
 
         # Position
         self.x = x
         self.y = y
 
+        # Random defaults are drawn from the landscape's pool, see `Landscape.random()`
+        rand = landscape.random
+
         # Survival factors
-        self.fov = fov if fov is not None else random.randint(1, 6)
-        self.endowment = (
-            endowment if endowment is not None else random.uniform(50.0, 100.0)
-        )
+        self.fov = fov if fov is not None else 1 + int(6 * rand())
+        self.endowment = endowment if endowment is not None else 50.0 + 50.0 * rand()
         self.wealth = self.endowment
-        self.metabolism = (
-            metabolism if metabolism is not None else random.uniform(1.0, 4.0)
-        )
-        self.lifespan = (
-            lifespan if lifespan is not None else random.uniform(60.0, 100.0)
-        )
+        self.metabolism = metabolism if metabolism is not None else 1.0 + 3.0 * rand()
+        self.lifespan = lifespan if lifespan is not None else 60.0 + 40.0 * rand()
         self.alive = True
 
         # Reproduction factors
         self.can_reproduce = True
         self.time_of_birth = landscape.time
-        self.sex = random.choice(
-            list(Sex)
-        )  # Enum for sex either MALE = False or Female = True
-        self._fertiliy_begin = random.uniform(12.0, 15.0)
-        self._fertiliy_end = (
-            random.uniform(40.0, 50.0) if self.sex else random.uniform(50.0, 60.0)
-        )
+        # Sex as a bool, either MALE = False or FEMALE = True
+        self.sex = rand() < 0.5
+        self._fertiliy_begin = 12.0 + 3.0 * rand()
+        self._fertiliy_end = 40.0 + 10.0 * rand() if self.sex else 50.0 + 10.0 * rand()
         self.gestation_period = 0
 
+        # Cache for empty_neighbors, tagged with the occupancy version it was computed at
+        self._cached_empty: FrozenSet[int] = frozenset()
+        self._cached_empty_version = -1
+
     def __str__(self) -> str:
         return f"Agent[id:{id}]"
 
-    @classmethod
-    def next_id(cls) -> int:
-        """
-        Used to give a unique id to each agent. Counts sequentially from 0
-
-        Returns:
-            int: Next id in sequence.
-        """
-        next_id = cls.curr_id
-        cls.curr_id += 1
-        return next_id
-
     @property
     def age(self) -> float:
         """
@@ -107,13 +161,21 @@ class Agent:
         )
 
     @property
-    def empty_neighbors(self) -> Optional[List[Cell]]:
+    def empty_neighbors(self) -> FrozenSet[int]:
         """
+        Cached until the landscape's occupancy changes, see `Landscape.occupancy_version`.
+
         Returns:
-            Optional[List[Cell]]: List of cells within fov that are empty, None if no cells are empty.
+            FrozenSet[int]: Set of cells within fov that are empty, as flat indices `x * Y + y`.
         """
-        neighbors = self._von_neumann_neighborhood()
-        return [cell for cell in neighbors if cell.occupancy is None]
+        landscape = self.parent
+        if self._cached_empty_version != landscape.occupancy_version:
+            cells = self._von_neumann_neighborhood()
+            empty = np.take(landscape.occupancy, cells) == -1
+            self._cached_empty = frozenset(cells[empty].tolist())
+            self._cached_empty_version = landscape.occupancy_version
+
+        return self._cached_empty
 
     def update(self) -> Tuple[bool, Optional[Agent]]:
         """
@@ -125,8 +187,7 @@ class Agent:
         """
         # Age check, kill agent if past lifespan.
         if self.age > self.lifespan:
-            current_cell = self.parent.cells[self.x][self.y]
-            current_cell.occupancy = None
+            self.parent.remove_agent(self)
             self.alive = False
             return (self.alive, None)
 
@@ -139,60 +200,14 @@ class Agent:
     def move(self) -> bool:
         """
         Moves agent to cell with the most resources within its fov. Ties are broken randomly and
-        the fov is calculated using `_von_neumann_neighborhood()`.
+        the fov is the agent's von Neumann neighborhood. See `move_agents()`.
 
         Returns:
             bool: `True` if agent is alive, `False` otherwise
         """
-        with self.parent.lock:
-            current_cell = self.parent.cells[self.x][self.y]
-
-            # Calculate wealth for agent and resource level at cell
-            self.wealth = max(
-                0, self.wealth + current_cell.resource_level - self.metabolism
-            )
-            current_cell.resource_level = 0
-
-            # Calculate if agent dies
-            if self.wealth <= 0:
-                self.alive = False
-                current_cell.occupancy = None
-                return self.alive
-
-            # Get cells to check
-            check_cells = self.empty_neighbors
-
-            # Random tie breaks implemented by shuffling list of cells
-            random.shuffle(check_cells)
-
-            # Grab cell with most resources
-            best_cell = max(
-                (cell for cell in check_cells if not cell.occupancy),
-                key=lambda c: c.resource_level,
-                default=None,
-            )
-
-            # If best cell is found move to it, theoritcally should never be None *shrug*.
-            if best_cell:
-                self._move_cell_to(best_cell)
-
+        move_agents(self.parent, [self])
         return self.alive
 
-    def _move_cell_to(self, cell: Cell) -> None:
-        """
-        Helper function for moving agent to specified cell. Mostly here to declutter `move()`.
-
-        Args:
-            cell (Cell): Reference to cell that agent will move to.
-        """
-        # Get ref to current cell and remove agent from its occupancy
-        current = self.parent.cells[self.x][self.y]
-        current.occupancy = None
-
-        # Move agent to new cell
-        self.x, self.y = cell.x, cell.y
-        cell.occupancy = self
-
     def reproduce(self) -> Optional[Agent]:
         """
         Handles the reproduction logic for the agent. The general idea is to find 4 candidates
@@ -206,74 +221,100 @@ class Agent:
         if not self.fertile:
             return None
 
-        with self.parent.lock:
-            # Get von Neumann neighborhood with radius self.fov
-            neighbor_cells = self._von_neumann_neighborhood()
-
-            # Identify 4 possible candidates
-            candidates: List[Agent, float] = []
-            for cell in neighbor_cells:
-                if (
-                    cell.occupancy
-                    and cell.occupancy.sex != self.sex
-                    and cell.occupancy.fertile
-                ):
-                    candidates.append(cell.occupancy)
-                    if len(candidates) >= 4:
-                        break
-
-            # If none are found, reproduction attept failed return None
-            if not candidates:
-                return None
-
-            # Cache the empty cells for current agent
-            own_empty_neighbors = set(self.empty_neighbors)
-
-            # Pick partner with most wealth where a empty cell exists in either agent's
-            # von Neumann neighborhood
-            partner = None
-            best_wealth = -float("inf")
-            for candidate in candidates:
-                candidate_empty_neighbors = set(candidate.empty_neighbors)
-                union_empty_cells = own_empty_neighbors.union(candidate_empty_neighbors)
-                if union_empty_cells and candidate.wealth > best_wealth:
-                    best_wealth = candidate.wealth
-                    partner = candidate
-
-            # If suitable partner is found, create new agent.
-            if partner and union_empty_cells:
-                offspring_pos = random.choice(list(union_empty_cells))
-                offspring = Agent(
-                    x=offspring_pos.x,
-                    y=offspring_pos.y,
-                    landscape=self.parent,
-                    endowment=(self.endowment + partner.endowment) / 2,
-                )
-
-                offspring_pos.occupancy = offspring
-                self.can_reproduce = False
-
-                return offspring
+        return self._reproduce()
+
+    def _reproduce(self) -> Optional[Agent]:
+        """
+        Same as `reproduce()` but without checking the agent is fertile, for callers that have
+        already checked, like `simulate_step()` which checks all agents at once.
+
+        Returns:
+            Optional[Agent]: If reproduction is successful the offspring is returned, otherwise None.
+        """
+        landscape = self.parent
+
+        # Get agents of opposite sex in von Neumann neighborhood with radius self.fov, the
+        # occupancy grid acts as a spatial hash with one bucket per cell
+        occupant_ids = np.take(landscape.occupancy, self._von_neumann_neighborhood())
+        occupant_ids = occupant_ids[occupant_ids != -1]
+        occupant_ids = occupant_ids[landscape.agent_sex[occupant_ids] != self.sex]
+
+        # Neighborhood cells come in a fixed order, so shuffle before taking the first 4
+        # candidates, otherwise partners would always be picked from the same side
+        if len(occupant_ids) > 4:
+            occupant_ids = occupant_ids[landscape.rng.permutation(len(occupant_ids))]
+
+        # Identify 4 possible candidates
+        agents = landscape.agents
+        candidates: List[Agent, float] = []
+        for occupant_id in occupant_ids.tolist():
+            occupant = agents[occupant_id]
+            if occupant.fertile:
+                candidates.append(occupant)
+                if len(candidates) >= 4:
+                    break
+
+        # If none are found, reproduction attept failed return None
+        if not candidates:
+            return None
+
+        # Cache the empty cells for current agent
+        own_empty_neighbors = self.empty_neighbors
+
+        # Pick partner with most wealth where a empty cell exists in either agent's
+        # von Neumann neighborhood
+        partner = None
+        partner_empty_cells: FrozenSet[int] = frozenset()
+        best_wealth = -float("inf")
+        for candidate in candidates:
+            union_empty_cells = own_empty_neighbors | candidate.empty_neighbors
+            if union_empty_cells and candidate.wealth > best_wealth:
+                best_wealth = candidate.wealth
+                partner = candidate
+                partner_empty_cells = union_empty_cells
+
+        # If suitable partner is found, create new agent in one of the empty cells around
+        # the pair, picked with the landscape's seeded generator.
+        if partner:
+            cells = tuple(partner_empty_cells)
+            offspring_x, offspring_y = divmod(
+                cells[int(landscape.random() * len(cells))], landscape.Y
+            )
+            offspring = Agent(
+                x=offspring_x,
+                y=offspring_y,
+                landscape=landscape,
+                endowment=(self.endowment + partner.endowment) / 2,
+            )
+
+            landscape.place_agent(offspring)
+            self.can_reproduce = False
+
+            return offspring
 
         return None
 
-    def _von_neumann_neighborhood(self) -> List[Cell]:
+    def _von_neumann_neighborhood(self) -> np.ndarray:
         """
-        Helper function to calculate possible reproduction cells.
+        Helper function to calculate possible reproduction cells. Offsets that fall outside the
+        landscape are dropped, which leaves the same cells as clamping them to the edge would.
 
         Returns:
-            List[Cell]: List of possible reproduction cells.
+            np.ndarray: Flat indices `x * Y + y` of possible reproduction cells, usable with
+            `np.take()` on the landscape arrays.
         """
-        neighbors = set()
+        # Position and fov are read from the landscape arrays, so read each only once
+        landscape = self.parent
+        fov = self.fov
 
-        for dx in range(-self.fov, self.fov + 1):
-            for dy in range(-self.fov + abs(dx), self.fov - abs(dx) + 1):
-                nx, ny = self.x + dx, self.y + dy
-                bounded_x = max(0, min(nx, self.parent.X - 1))
-                bounded_y = max(0, min(ny, self.parent.Y - 1))
-                neighbors.add(self.parent.cells[bounded_x][bounded_y])
+        offsets = _DIAMOND_OFFSETS.get(fov)
+        if offsets is None:
+            offsets = _DIAMOND_OFFSETS[fov] = _diamond_offsets(fov)
 
-        return list(neighbors)
+        xs = self.x + offsets[:, 0]
+        ys = self.y + offsets[:, 1]
+        inside = (xs >= 0) & (xs < landscape.X) & (ys >= 0) & (ys < landscape.Y)
+        return xs[inside] * landscape.Y + ys[inside]
 
 
 def init_agents(landscape: Landscape, num_agents: int) -> List[Agent]:
@@ -286,21 +327,248 @@ def init_agents(landscape: Landscape, num_agents: int) -> List[Agent]:
     Returns:
         List[Agent]: List of all newly intialized agents.
     """
-    X = landscape.X
     Y = landscape.Y
-    cells = landscape.cells
+
+    # Only the empty cells can take a new agent, a negative count places none
+    free_cells = np.flatnonzero(landscape.occupancy == -1)
+    num_agents = max(0, min(num_agents, len(free_cells)))
+
+    # Draw the positions and attributes of every agent up front, positions are drawn without
+    # replacement so no two agents share a cell
+    rng = landscape.rng
+    cells = rng.choice(free_cells, size=num_agents, replace=False)
+    xs, ys = np.divmod(cells, Y)
+    fovs = rng.integers(1, 7, size=num_agents).tolist()
+    metabolisms = rng.uniform(1.0, 4.0, size=num_agents).tolist()
+    endowments = rng.uniform(50.0, 100.0, size=num_agents).tolist()
+    lifespans = rng.uniform(60.0, 100.0, size=num_agents).tolist()
 
     agents = []
+    for i, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+        agent = Agent(
+            x=x,
+            y=y,
+            landscape=landscape,
+            fov=fovs[i],
+            metabolism=metabolisms[i],
+            endowment=endowments[i],
+            lifespan=lifespans[i],
+        )
+        landscape.place_agent(agent)
+        agents.append(agent)
 
-    num_agents = min(num_agents, X * Y)
+    return agents
 
-    while len(agents) < num_agents:
-        x = random.randint(0, X - 1)
-        y = random.randint(0, Y - 1)
 
-        if not cells[x][y].occupancy:
-            agent = Agent(x=x, y=y, landscape=landscape)
-            cells[x][y].occupancy = agent
-            agents.append(agent)
+def move_agents(landscape: Landscape, agents: List[Agent]) -> None:
+    """
+    Moves every agent in `agents` with a single call into compiled code. Each agent consumes the
+    resources at its cell and, if it survives, moves to the empty cell with the most resources
+    within its fov. Agents that starve are removed from the landscape. Agents are moved column
+    by column, see `_sweep_order()`.
 
-    return agents
+    Args:
+        landscape (Landscape): Reference to parent landscape class for all agents.
+        agents (List[Agent]): Agents to move, all must be alive and placed on `landscape`.
+    """
+    ids = np.fromiter((agent.id for agent in agents), dtype=np.int64, count=len(agents))
+    order = ids[_sweep_order(landscape, landscape.agent_x[ids])]
+
+    _tick_batch(
+        order,
+        landscape.agent_x,
+        landscape.agent_y,
+        landscape.agent_fov,
+        landscape.agent_wealth,
+        landscape.agent_metabolism,
+        landscape.agent_alive,
+        landscape.resource_level,
+        landscape.occupancy,
+        landscape.rng_state,
+    )
+    landscape.occupancy_version += 1
+
+    for agent_id in order[~landscape.agent_alive[order]].tolist():
+        landscape.remove_agent(landscape.agents[agent_id])
+
+
+def _sweep_order(landscape: Landscape, xs: np.ndarray) -> np.ndarray:
+    """
+    Helper function to order agents column by column, so agents moved one after another read
+    overlapping parts of the landscape arrays. The sweep starts at a random column, runs in a
+    random direction and wraps around, and agents within a column are shuffled. That way no
+    column or neighbor consistently gets to move first.
+
+    Args:
+        landscape (Landscape): Reference to parent landscape class for all agents.
+        xs (np.ndarray): x-coords of the agents to order.
+    Returns:
+        np.ndarray: Indices into `xs` in the order the agents should move.
+    """
+    rng = landscape.rng
+    start = rng.integers(landscape.X)
+    direction = 1 if rng.random() < 0.5 else -1
+    columns = (direction * (xs - start)) % landscape.X
+
+    # Jitter is below 1, so it only shuffles agents within a column
+    return np.argsort(columns + rng.random(len(xs)))
+
+
+# Source for the compiled move step of a single agent. Moves the agent to the empty cell with the
+# most resources in its von Neumann neighborhood, updating `occupancy` in place. `rng_state` holds
+# the xorshift64 state used to break ties and is advanced in place. Returns the new `(x, y)`.
+#
+# `{fov}` is filled in by `_compile()`, either with the `fov` argument for the generic kernel or
+# with a literal so the neighborhood loops of that kernel have constant bounds.
+_MOVE_AGENT_SOURCE = """
+def {name}(agent_id, x, y, fov, resource_level, occupancy, rng_state):
+    X, Y = resource_level.shape
+
+    # Grab empty cell with most resources within fov in a single pass, cells outside the
+    # landscape are skipped. Ties are broken randomly by comparing the resource level with 8
+    # random bits appended, so there is no branch for ties.
+    state = rng_state[0]
+    best_x = -1
+    best_y = -1
+    best_key = -1
+    for dx in range(-{fov}, {fov} + 1):
+        nx = x + dx
+        if nx < 0 or nx >= X:
+            continue
+        reach = {fov} - abs(dx)
+        for dy in range(-reach, reach + 1):
+            ny = y + dy
+            if ny < 0 or ny >= Y or occupancy[nx, ny] != -1:
+                continue
+
+            state ^= state << np.uint64(13)
+            state ^= state >> np.uint64(7)
+            state ^= state << np.uint64(17)
+            key = (np.int64(resource_level[nx, ny]) << 8) | np.int64(
+                state & np.uint64(0xFF)
+            )
+            if key > best_key:
+                best_key = key
+                best_x = nx
+                best_y = ny
+    rng_state[0] = state
+
+    # If best cell is found move to it
+    if best_x != -1:
+        occupancy[x, y] = -1
+        x = best_x
+        y = best_y
+        occupancy[x, y] = agent_id
+
+    return x, y
+"""
+
+# Source for the compiled tick of a batch of agents, compiled with `parallel=True`. Every agent in
+# `order` first consumes the resources at its cell, then the agents move one after another in
+# `order` using the move kernel matching their fov. Results are written back to the agent arrays
+# and agents that starve are left in `agents` for the caller to remove, their cells are freed.
+# `{dispatch}` is filled in with one branch per specialized kernel.
+_TICK_BATCH_SOURCE = """
+def _tick_batch(
+    order,
+    agent_x,
+    agent_y,
+    agent_fov,
+    agent_wealth,
+    agent_metabolism,
+    agent_alive,
+    resource_level,
+    occupancy,
+    rng_state,
+):
+    # Calculate wealth for agents and resource level at their cells. Each cell holds one agent
+    # and agents only move into empty cells, so every agent would find its cell untouched at its
+    # turn anyway. That makes this independent per agent and safe to run in parallel.
+    for k in prange(len(order)):
+        i = order[k]
+        x = agent_x[i]
+        y = agent_y[i]
+        agent_wealth[i] = max(
+            0.0, agent_wealth[i] + resource_level[x, y] - agent_metabolism[i]
+        )
+        agent_alive[i] = agent_wealth[i] > 0
+        resource_level[x, y] = 0
+
+    # Moves depend on where earlier agents went, so they run serially
+    for i in order:
+        # Agents that starved free their cell at their turn
+        if not agent_alive[i]:
+            occupancy[agent_x[i], agent_y[i]] = -1
+            continue
+
+        fov = agent_fov[i]
+{dispatch}
+        else:
+            x, y = _move_agent(
+                i, agent_x[i], agent_y[i], fov, resource_level, occupancy, rng_state
+            )
+
+        agent_x[i] = x
+        agent_y[i] = y
+"""
+
+_TICK_BATCH_BRANCH = """
+        {keyword} fov == {fov}:
+            x, y = _move_agent_fov{fov}(
+                i, agent_x[i], agent_y[i], fov, resource_level, occupancy, rng_state
+            )"""
+
+
+def _compile(name: str, source: str, parallel: bool = False) -> Callable[..., Any]:
+    """
+    Compiles generated source with Numba and binds the result to `name` in this module, so
+    other generated kernels can call it.
+
+    Args:
+        name (str): Name of the function defined by `source`.
+        source (str): Python source defining the function.
+        parallel (bool): Compile with Numba's `parallel=True`, needed for `prange`. Default is `False`.
+    Returns:
+        Callable[..., Any]: Compiled function.
+    """
+    # Compiled against this file so Numba can cache the kernels, the cache is invalidated
+    # whenever this file changes.
+    exec(compile(source, __file__, "exec"), globals())
+    kernel = globals()[name] = njit(cache=True, parallel=parallel)(globals()[name])
+    return kernel
+
+
+# Default fov values, each gets a move kernel specialized for it
+_KERNEL_FOVS = range(1, 7)
+
+# Generic kernel, used for any fov without a specialized kernel
+_move_agent = _compile(
+    "_move_agent", _MOVE_AGENT_SOURCE.format(name="_move_agent", fov="fov")
+)
+
+
+def _compile_fov_kernels() -> None:
+    """
+    Compiles a move kernel specialized for each fov in `_KERNEL_FOVS`, bound as
+    `_move_agent_fov<fov>`. Done in a function so the loop variable doesn't end up in the
+    module globals the kernel sources are compiled in.
+    """
+    for fov in _KERNEL_FOVS:
+        _compile(
+            f"_move_agent_fov{fov}",
+            _MOVE_AGENT_SOURCE.format(name=f"_move_agent_fov{fov}", fov=fov),
+        )
+
+
+_compile_fov_kernels()
+
+_tick_batch = _compile(
+    "_tick_batch",
+    _TICK_BATCH_SOURCE.format(
+        dispatch="".join(
+            _TICK_BATCH_BRANCH.format(keyword="elif" if i else "if", fov=fov)
+            for i, fov in enumerate(_KERNEL_FOVS)
+        )
+    ),
+    parallel=True,
+)
@@ -3,57 +3,57 @@
 
 from __future__ import annotations
 
-import threading
-from typing import Any, Callable, List, Tuple, TYPE_CHECKING
+import itertools
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
 
-from capacity_models import two_peak_guassian
+import numpy as np
+
+from capacity_models import two_peak_gaussian_grid
 
 if TYPE_CHECKING:
     from components import Agent
 
 
-class Cell:
-    """
-    Simple class to store data on each cell in the landscape.
-    """
+# Name and dtype of each per-agent state array kept on the landscape
+AGENT_ARRAYS = (
+    ("agent_x", np.int32),
+    ("agent_y", np.int32),
+    ("agent_fov", np.int32),
+    ("agent_wealth", np.float64),
+    ("agent_metabolism", np.float64),
+    ("agent_alive", np.bool_),
+    ("agent_sex", np.bool_),
+    ("agent_birth", np.int64),
+    ("agent_lifespan", np.float64),
+    ("agent_endowment", np.float64),
+    ("agent_fertility_begin", np.float64),
+    ("agent_fertility_end", np.float64),
+)
 
-    def __init__(
-        self,
-        x: int,
-        y: int,
-        capacity: float,
-        regrowth_rate: float,
-    ) -> None:
-        """
-        Args:
-            x (int): x-coord of cell
-            y (int): y-coord of cell
-            capacity (float): Maximum amount of resources the cell can contain.
-            regrowth_rate (float): Rate at which resources replenish.
-        """
-        self.x = x
-        self.y = y
-
-        self.occupancy: Agent = None
-        self.capacity = capacity
-        self.resource_level: float = self.capacity
-        self.regrowth_rate = regrowth_rate
-
-    def __str__(self) -> str:
-        return f"Cell({self.x}, {self.y})[occupancy: {self.occupancy}]"
+# Number of uniform randoms drawn at once by Landscape.random()
+RANDOM_POOL_SIZE = 4096
 
 
 class Landscape:
     """
     Class that manages all the cells and all the agents.
+
+    Cell data is stored as parallel `(X, Y)` arrays rather than one object per cell:
+    `capacity`, `resource_level` and `occupancy`, where `occupancy[x, y]` is the id of the
+    agent in the cell or `-1` if the cell is empty.
+
+    Agent state read every tick is stored the same way, in the `AGENT_ARRAYS` arrays indexed
+    by agent id, so a whole tick of moves can be run in compiled code and age and fertility
+    checks can be done for all agents at once.
     """
 
     def __init__(
         self,
         size: Tuple[int, int] = (50, 50),
         regrowth_rate: float = 1.0,
-        capacity_function: Callable[..., int] = two_peak_guassian,
+        capacity_function: Callable[..., np.ndarray] = two_peak_gaussian_grid,
         *args: Any,
+        seed: Optional[int] = None,
         **kwargs: Any,
     ) -> None:
         """
@@ -61,36 +61,121 @@ class Landscape:
             size (Tuple[int, int]): Size of landscape in form `(max_x, max_y)`. Default `(50, 50)`
             num_agents (int): Number of agents to attempt to place, may not place full amount due to collisions. Default is `10`
             regrowth_rate (float): Rate at which cells replenish resources. Default is `1.0`.
-            capacity_function (Callable[..., int]): Function used to calculate capacity at each cell. Should be a function `f(x, y)` that returns an `int`. Default is `two_peak_guassian()`.
+            capacity_function (Callable[..., np.ndarray]): Function used to calculate capacity of the whole landscape. Should be a function `f(X, Y)` that returns an integer array of shape `(X, Y)` with values in `[0, 255]`. Default is `two_peak_gaussian_grid()`.
             *args (Any): Args for capacity function.
+            seed (Optional[int]): Seed for the landscape's random number generator. Default is `None`, which seeds from the OS.
             **kwargs (Any): Keyword args for capacity function.
         """
         self.X, self.Y = size
         self.time = 0
 
-        # Lock for synchronizing access to cells and agents.
-        self.lock = threading.Lock()
-
-        # Intialize cells
-        self.cells: List[List[Cell]] = [
-            [
-                Cell(
-                    x=x,
-                    y=y,
-                    capacity=capacity_function(x, y, *args, **kwargs),
-                    regrowth_rate=regrowth_rate,
-                )
-                for y in range(self.Y)
-            ]
-            for x in range(self.X)
-        ]
+        # Random number generator for agent attributes, see random()
+        self.rng = np.random.default_rng(seed)
+        self._random_pool: List[float] = []
+        self._random_index = 0
+
+        # State of the xorshift64 generator used to break ties when agents move, must be non-zero
+        self.rng_state: np.ndarray = self.rng.integers(
+            1, 2**64 - 1, size=1, dtype=np.uint64, endpoint=True
+        )
+
+        # Intialize cells, every cell starts full. Resource levels are small integers, so they
+        # are stored in a byte each to keep the memory touched by regrowth and neighborhood
+        # scans small.
+        capacity = np.asarray(capacity_function(self.X, self.Y, *args, **kwargs))
+        if capacity.min() < 0 or capacity.max() > np.iinfo(np.uint8).max:
+            raise ValueError(
+                f"Capacities must be in [0, 255], got [{capacity.min()}, {capacity.max()}]"
+            )
+        self.capacity: np.ndarray = capacity.astype(np.uint8)
+        self.resource_level: np.ndarray = self.capacity.copy()
+        self.occupancy: np.ndarray = np.full((self.X, self.Y), -1, dtype=np.int32)
+        self.regrowth_rate = regrowth_rate
+
+        # Lookup from agent id to agent for every agent placed on the landscape
+        self.agents: Dict[int, Agent] = {}
+
+        # Bumped on every change to occupancy, lets agents cache what they see around them
+        self.occupancy_version = 0
+
+        # Gives a unique id to each agent, counting sequentially from 0. Ids double as the
+        # agent's index into the per-agent arrays.
+        self.next_agent_id: Callable[[], int] = itertools.count().__next__
+
+        # Per-agent state, grown on demand by reserve_agent()
+        for name, dtype in AGENT_ARRAYS:
+            setattr(self, name, np.zeros(0, dtype=dtype))
+
+    def random(self) -> float:
+        """
+        Draws a single uniform random number. Numbers are drawn from `rng` in bulk and handed
+        out one at a time, which is much cheaper than a call into `rng` per number.
+
+        Returns:
+            float: Random number in `[0.0, 1.0)`.
+        """
+        if self._random_index >= len(self._random_pool):
+            self._random_pool = self.rng.random(RANDOM_POOL_SIZE).tolist()
+            self._random_index = 0
+
+        value = self._random_pool[self._random_index]
+        self._random_index += 1
+        return value
+
+    def reserve_agent(self, agent_id: int) -> None:
+        """
+        Grows the per-agent arrays, if needed, so they have a slot for `agent_id`. Arrays are
+        at least doubled when grown to keep reallocations rare.
+
+        Args:
+            agent_id (int): Id of the agent that needs a slot.
+        """
+        size = len(self.agent_x)
+        if agent_id < size:
+            return
+
+        new_size = max(2 * size, agent_id + 1, 64)
+        for name, dtype in AGENT_ARRAYS:
+            grown = np.zeros(new_size, dtype=dtype)
+            grown[:size] = getattr(self, name)
+            setattr(self, name, grown)
+
+    def place_agent(self, agent: Agent) -> None:
+        """
+        Marks the cell at the agent's position as occupied by the agent.
+
+        Args:
+            agent (Agent): Agent to place, its cell is expected to be empty.
+        """
+        self.occupancy[agent.x, agent.y] = agent.id
+        self.agents[agent.id] = agent
+        self.occupancy_version += 1
+
+    def remove_agent(self, agent: Agent) -> None:
+        """
+        Empties the cell at the agent's position and forgets the agent. Agents that starve
+        have already left their cell during the batched move step, which may have refilled it,
+        so the cell is only emptied if the agent is still in it.
+
+        Args:
+            agent (Agent): Agent to remove.
+        """
+        cell = (agent.x, agent.y)
+        if self.occupancy[cell] == agent.id:
+            self.occupancy[cell] = -1
+        del self.agents[agent.id]
+        self.occupancy_version += 1
 
     def regrowth(self) -> None:
         """
         Applies regrowth rate to each cell to replenish resources at each cell up to capacity.
         """
-        for X in self.cells:
-            for cell in X:
-                cell.resource_level = int(
-                    min(cell.capacity, cell.resource_level + cell.regrowth_rate)
-                )
+        # Levels are whole numbers so adding a fractional rate then truncating is the same as
+        # adding the whole part of the rate. Adding that directly keeps the work in the array's
+        # own dtype instead of going through float64. Levels never exceed capacity, so growing
+        # by at most the headroom left in each cell can't overflow the byte-sized levels.
+        step = min(int(self.regrowth_rate), np.iinfo(np.uint8).max)
+        if step:
+            headroom = self.capacity - self.resource_level
+            np.minimum(headroom, step, out=headroom)
+            self.resource_level += headroom
@@ -4,12 +4,24 @@
 from typing import List
 
 import matplotlib.pyplot as plt
+import numpy as np
 
 
-def plot_population_totals(population_totals: List[int]) -> None:
+def plot_population_totals(population_totals: np.ndarray) -> None:
     plt.figure(figsize=(10, 6))
     plt.plot(population_totals, marker="o", linestyle="-", color="b")
     plt.title("Population Totals Over Time")
     plt.xlabel("Time Step")
     plt.ylabel("Population")
     plt.show()
+
+
+def plot_population_runs(population_runs: List[np.ndarray]) -> None:
+    plt.figure(figsize=(10, 6))
+    for run, population_totals in enumerate(population_runs, start=1):
+        plt.plot(population_totals, linestyle="-", label=f"Run {run}")
+    plt.title("Population Totals Over Time")
+    plt.xlabel("Time Step")
+    plt.ylabel("Population")
+    plt.legend()
+    plt.show()
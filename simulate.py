@@ -2,17 +2,20 @@
 # Copyright (c) 2024 Iain Crowe <iainccrowe@gmail.com>
 
 import argparse
-import cProfile
-import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import os
 import platform
-import random
 import sys
 import time
 from typing import List, Optional, Tuple
 
+import numba
+import numpy as np
+
 from components import Agent, Landscape
-from components import init_agents
-from plot import plot_population_totals
+from components import init_agents, move_agents
+from plot import plot_population_runs, plot_population_totals
 
 # Color map for landscape printing
 # This map supports values up to 9, which should be good for any map up to
@@ -37,6 +40,27 @@ AGENT = "\033[30;43m"
 CLEAR_SCREEN = "\033[2J"
 CURSOR_UP_LEFT = "\033[H"
 
+# Minimum time in seconds between updates of the progress line
+PROGRESS_INTERVAL = 0.1
+
+# Printed cells, built once rather than for every cell of every frame
+EMPTY_CELL = tuple(f"{color}  {RESET}" for color in COLOR_MAP)
+AGENT_CELL = f"{AGENT}  {RESET}"
+
+# Lookup from cell index to printed cell, the first entry is an occupied cell and resource
+# level `n` is at index `n + 1`, so no resource level can be mistaken for an agent
+CELL_STRINGS = np.array((AGENT_CELL,) + EMPTY_CELL, dtype=object)
+
+# The key never changes, so it is also built once
+KEY = (
+    "Key:\n"
+    + "".join(
+        f"{i} = {color[:-1]};4m  {RESET}" + ("\n" if (i + 1) % 4 == 0 else "; ")
+        for i, color in enumerate(COLOR_MAP)
+    )
+    + f"Agent = {AGENT[:-1]};4m  {RESET}"
+)
+
 # For windows...
 if platform.system() == "Windows":
     import ctypes
@@ -90,42 +114,128 @@ def main():
         action="store_true",
         help="Display the resource map at each step in simulation.",
     )
+    parser.add_argument(
+        "--quiet",
+        "-q",
+        action="store_true",
+        help="Skip the maps, progress updates and population plot, only print a summary line.",
+    )
+
+    parser.add_argument(
+        "--runs",
+        "-N",
+        type=int,
+        default=1,
+        help="Number of independent runs, more than one runs them in parallel processes without displaying maps.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed for the random number generators, each run gets its own stream derived from it.",
+    )
 
     args = parser.parse_args()
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+    if args.time < 0:
+        parser.error("--time must be at least 0")
+
+    # Line buffer a terminal so frames show up straight away, leave pipes and files block
+    # buffered so they are written in large chunks
+    interactive = sys.stdout.isatty()
+    sys.stdout.reconfigure(line_buffering=interactive, write_through=False)
+
+    seeds = np.random.SeedSequence(args.seed).spawn(args.runs)
+
+    if args.runs <= 1:
+        population_totals, final_population = run_one(seeds[0], args, interactive)
+        if args.quiet:
+            print(_summary(population_totals, final_population, args))
+        else:
+            plot_population_totals(population_totals)
+        return
+
+    # Runs are independent, so run them in separate processes. Maps would interleave, so runs
+    # only report their summary line. Each process gets an even share of the cores for the
+    # parallel parts of the tick.
+    worker_args = argparse.Namespace(**{**vars(args), "display": False, "quiet": True})
+    max_workers = min(args.runs, os.cpu_count() or 1)
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=numba.set_num_threads,
+        initargs=(max(1, numba.config.NUMBA_NUM_THREADS // max_workers),),
+    ) as executor:
+        results = list(
+            executor.map(functools.partial(run_one, args=worker_args), seeds)
+        )
+
+    for run, (population_totals, final_population) in enumerate(results, start=1):
+        print(f"Run {run}: {_summary(population_totals, final_population, args)}")
+    if not args.quiet:
+        plot_population_runs([population_totals for population_totals, _ in results])
+
+
+def run_one(
+    seed: np.random.SeedSequence,
+    args: argparse.Namespace,
+    interactive: bool = False,
+) -> Tuple[np.ndarray, int]:
+    """
+    Runs a single simulation with the parsed command-line arguments.
+
+    Args:
+        seed (np.random.SeedSequence): Seeds the capacity function arguments and the landscape for this run.
+        args (argparse.Namespace): Parsed command-line arguments.
+        interactive (bool): Whether stdout is a terminal, the progress line is only shown on one.
+
+    Returns:
+        Tuple[np.ndarray, int]: Population after each cycle that was run and the final
+        population, which is the starting population if no cycles were run.
+    """
+    # Independent streams for the capacity function arguments and the landscape
+    capacity_seed, landscape_seed = seed.spawn(2)
 
     # Set up landscape and agents
     capacity_function_args = {}
     if args.randomize:
+        rng = np.random.default_rng(capacity_seed)
         capacity_function_args = {
-            "bounds": (args.max_width, args.max_height),
-            "psi": random.uniform(1.0, 5.0),
-            "peak1": (random.uniform(0.1, 0.9), random.uniform(0.1, 0.9)),
-            "peak2": (random.uniform(0.1, 0.9), random.uniform(0.1, 0.9)),
-            "theta_x": random.uniform(0.1, 0.5),
-            "theta_y": random.uniform(0.1, 0.5),
+            "psi": rng.uniform(1.0, 5.0),
+            "peak1": (rng.uniform(0.1, 0.9), rng.uniform(0.1, 0.9)),
+            "peak2": (rng.uniform(0.1, 0.9), rng.uniform(0.1, 0.9)),
+            "theta_x": rng.uniform(0.1, 0.5),
+            "theta_y": rng.uniform(0.1, 0.5),
         }
-    else:
-        capacity_function_args = {"bounds": (args.max_width, args.max_height)}
 
     display = args.display
 
     landscape = Landscape(
         size=(args.max_width, args.max_height),
+        seed=landscape_seed,
         **capacity_function_args,
     )
 
     agents: List[Agent] = init_agents(landscape, args.agents)
 
-    population_totals = []
+    # Population after each cycle, sliced to the cycles actually run if all agents die
+    population_totals = np.empty(args.time, dtype=np.int32)
+    cycles_run = 0
 
-    print("Initial Map:")
-    print_landscape(landscape, len(agents))
+    quiet = args.quiet
+    if not quiet:
+        print("Initial Map:")
+        print_landscape(landscape, len(agents))
 
+    next_progress = 0.0
     for i in range(1, args.time + 1):
-        random.shuffle(agents)
+        # Shuffle with a permutation drawn from the landscape's generator, much cheaper than
+        # random.shuffle which draws one Python random per agent
+        order = landscape.rng.permutation(len(agents)).tolist()
+        agents = [agents[j] for j in order]
 
         # Move and reproduce agents
-        new_agents = simulate_step(agents)
+        new_agents = simulate_step(landscape, agents)
 
         # Regrow landscape
         landscape.regrowth()
@@ -133,50 +243,105 @@ def main():
 
         # Update agent list
         agents = new_agents
-        population_totals.append(len(agents))
+        population_totals[i - 1] = len(agents)
+        cycles_run = i
 
         if display:
             print_landscape(landscape, len(agents), (i, args.time))
             time.sleep(args.sleep_time)
-        print(
-            f"Current Population at ({i} of {args.time}): {len(agents)}",
-            end="\r",
-        )
+        # Progress is throttled, the last cycle and extinction are always shown
+        now = time.monotonic()
+        if (
+            interactive
+            and not quiet
+            and (now >= next_progress or i == args.time or not agents)
+        ):
+            print(
+                f"Current Population at ({i} of {args.time}): {len(agents)}",
+                end="\r",
+            )
+            next_progress = now + PROGRESS_INTERVAL
 
         if len(agents) <= 0:
-            print("\nAll agents have died.")
+            if not quiet:
+                print("\nAll agents have died.")
             break
 
-    print_landscape(landscape, len(agents))
-    plot_population_totals(population_totals)
+    if not quiet:
+        print_landscape(landscape, len(agents))
+
+    return population_totals[:cycles_run], len(agents)
+
+
+def _summary(
+    population_totals: np.ndarray, final_population: int, args: argparse.Namespace
+) -> str:
+    """
+    Args:
+        population_totals (np.ndarray): Population after each cycle of a run.
+        final_population (int): Population at the end of the run.
+        args (argparse.Namespace): Parsed command-line arguments.
+
+    Returns:
+        str: One line summary of a run.
+    """
+    return f"Final Population after {len(population_totals)} of {args.time} cycles: {final_population}"
 
 
-def simulate_step(agents: List[Agent]) -> List[Agent]:
+def simulate_step(landscape: Landscape, agents: List[Agent]) -> List[Agent]:
     """
-    Multithreaded call to update all agents.
+    Updates all agents in order. Agents past their lifespan die first, then all remaining agents
+    move in a single batched call and finally the survivors attempt to reproduce.
 
     Args:
+        landscape (Landscape): A reference to the landscape object.
         agents (List[Agent]): List of currently alive agents.
 
     Returns:
         List[Agent]: New list of agents after update sequence has completed.
     """
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        results = list(executor.map(lambda agent: agent.update(), agents))
+    # Age and fertility only depend on per-agent arrays, so check them for all agents at once
+    ids = np.fromiter((agent.id for agent in agents), dtype=np.int64, count=len(agents))
+    age = landscape.time - landscape.agent_birth[ids]
+
+    # Age check, kill agents past their lifespan.
+    too_old = age > landscape.agent_lifespan[ids]
+    movers: List[Agent] = []
+    for agent, dies in zip(agents, too_old.tolist()):
+        if dies:
+            landscape.remove_agent(agent)
+            agent.alive = False
+        else:
+            movers.append(agent)
+
+    move_agents(landscape, movers)
+
+    # Survivors attempt to reproduce, only fertile agents can find a partner. Reproducing
+    # doesn't change anyone's wealth or age, so fertility can be decided before the loop.
+    alive = landscape.agent_alive[ids]
+    fertile = (
+        alive
+        & (landscape.agent_fertility_begin[ids] <= age)
+        & (age <= landscape.agent_fertility_end[ids])
+        & (landscape.agent_wealth[ids] >= landscape.agent_endowment[ids])
+    )
 
     alive_agents: List[Agent] = []
     offspring: List[Agent] = []
-    for idx, (alive, child) in enumerate(results):
-        if alive:
-            alive_agents.append(agents[idx])
-        if child:
-            offspring.append(child)
+    for agent, is_alive, is_fertile in zip(agents, alive.tolist(), fertile.tolist()):
+        if not is_alive:
+            continue
+
+        alive_agents.append(agent)
+        if is_fertile:
+            child = agent._reproduce()
+            if child:
+                # Offspring start out able to reproduce
+                offspring.append(child)
+        agent.can_reproduce = True
 
     alive_agents.extend(offspring)
 
-    for agent in alive_agents:
-        agent.can_reproduce = True
-
     return alive_agents
 
 
@@ -193,37 +358,48 @@ def print_landscape(
         display_tag (bool): Tag to toggle displaying the resource values at each cell.
         t (Optional[Tuple[int, int]]): Optional argument used to pass which generation the landscape is on. Format is (Current, Total).
     """
-    print(CLEAR_SCREEN, end="")
-    print(CURSOR_UP_LEFT, end="")
+    # Levels never exceed capacity, so checking capacity covers every level the map can show
+    max_capacity = int(landscape.capacity.max(initial=0))
+    if max_capacity >= len(COLOR_MAP):
+        raise ValueError(
+            f"Can only print resource levels up to {len(COLOR_MAP) - 1}, capacity reaches {max_capacity}"
+        )
 
     string = f" {t[0]}/{t[1]}" if t else ""
-    w = landscape.Y * 2
-
-    print("=" * w)
-    print(f"\033[97;1mLandscape Map{string}:{RESET}")
-    print("=" * w)
-    # Print the key
-    print("Key:")
-    for i, color in enumerate(COLOR_MAP):
-        print(f"{i} = {color[:-1]};4m  {RESET}", end="\n" if (i + 1) % 4 == 0 else "; ")
-    print(f"Agent = {AGENT[:-1]};4m  {RESET}")
-    print("=" * w)
-    # Print the map
-    for X in landscape.cells:
-        for cell in X:
-            val = cell.resource_level
-            s = "  "
-            if isinstance(cell.occupancy, Agent):
-                print(f"{AGENT}{s}{RESET}", end="")
-            else:
-                print(f"{COLOR_MAP[val]}{s}{RESET}", end="")
-        print()
-    print("=" * w)
-    # Print number of agents on map
-    print(f"Agents: {num_agents}")
-    print("=" * w)
-
-    sys.stdout.flush()
+    separator, key_block = _frame_parts(landscape.Y * 2)
+
+    # Build the whole frame first and write it in one go, a print per cell is very slow
+    lines = [
+        f"{CLEAR_SCREEN}{CURSOR_UP_LEFT}{separator}",
+        f"\033[97;1mLandscape Map{string}:{RESET}",
+        key_block,
+    ]
+    # Build the map, occupied cells are swapped for the agent cell's index so every printed
+    # cell comes from one lookup
+    cell_index = np.where(landscape.occupancy >= 0, 0, landscape.resource_level + 1)
+    lines.extend("".join(row) for row in CELL_STRINGS[cell_index].tolist())
+    lines.append(separator)
+    # Number of agents on map
+    lines.append(f"Agents: {num_agents}")
+    lines.append(separator)
+
+    sys.stdout.write("\n".join(lines) + "\n")
+
+
+@functools.lru_cache(maxsize=None)
+def _frame_parts(width: int) -> Tuple[str, str]:
+    """
+    Builds the parts of a printed frame that only depend on its width, so they are built once
+    rather than every frame.
+
+    Args:
+        width (int): Width of the printed map in characters.
+
+    Returns:
+        Tuple[str, str]: The separator line and the key with separator lines around it.
+    """
+    separator = "=" * width
+    return separator, f"{separator}\n{KEY}\n{separator}"
 
 
 if __name__ == "__main__":